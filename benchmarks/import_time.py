@@ -0,0 +1,52 @@
+""" Measures the import time of the editor modules, each in a fresh interpreter.
+
+    python benchmarks/import_time.py [runs]
+
+Also reports whether importing a module pulled in Kivy or created a Window, which headless modules must not do.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["nodes_interface", "node_registry", "math_nodes", "node_cmd", "nodeeditor"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, 'kivy' in sys.modules, 'kivy.core.window' in sys.modules)
+"""
+
+
+def measure(module: str, runs: int) -> tuple[list[float], bool, bool]:
+    env = dict(os.environ, KIVY_NO_ARGS="1", KIVY_NO_CONSOLELOG="1", PYTHONDONTWRITEBYTECODE="1")
+    times = []
+    kivy = window = False
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", PROBE.format(module=module)],
+                                cwd=ROOT, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        t, kivy, window = result.stdout.split()
+        times.append(float(t))
+    return times, kivy == "True", window == "True"
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'module':20} {'median ms':>10} {'min ms':>10}  kivy  window")
+    for module in MODULES:
+        try:
+            times, kivy, window = measure(module, runs)
+        except RuntimeError as e:
+            print(f"{module:20} failed: {e}")
+            continue
+        print(f"{module:20} {statistics.median(times) * 1000:10.2f} {min(times) * 1000:10.2f}"
+              f"  {kivy!s:5} {window!s:5}")
+
+
+if __name__ == '__main__':
+    main()
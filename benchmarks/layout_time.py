@@ -0,0 +1,51 @@
+""" Times the full and the incremental layout of a random graph of math nodes.
+
+    python benchmarks/layout_time.py [nodes]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layout import layered_layout, relayout, LayerOccupancy
+from math_nodes import MathNodeProvider, MATH_NODE_TYPES
+
+
+def random_graph(n: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    provider = MathNodeProvider()
+    nodes = {}
+    for i in range(n):
+        node_id = str(i)
+        if i < max(2, n // 20):
+            nodes[node_id] = MATH_NODE_TYPES["ConstantNode"].create(node_id, {})
+            continue
+        node = nodes[node_id] = MATH_NODE_TYPES["BinopNode"].create(node_id, {})
+        for pin in ("a", "b"):
+            # Mostly local connections, like graphs that are built up step by step
+            source = str(max(0, i - 1 - int(rng.expovariate(0.05))))
+            provider.connect((nodes[source], "out"), (node, pin))
+    return nodes
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    nodes = random_graph(n)
+    start = time.perf_counter()
+    positions = layered_layout(nodes)
+    print(f"layered_layout of {n} nodes: {(time.perf_counter() - start) * 1000:.1f}ms")
+    start = time.perf_counter()
+    moved = relayout(nodes, positions, [str(n // 2)], radius=2)
+    print(f"relayout around one node: {(time.perf_counter() - start) * 1000:.1f}ms ({len(moved)} nodes moved)")
+    occupancy = LayerOccupancy()
+    for node_id, pos in positions.items():
+        occupancy.set(node_id, pos)
+    start = time.perf_counter()
+    moved = relayout(nodes, positions, [str(n // 2)], radius=2, occupancy=occupancy)
+    print(f"relayout with a kept occupancy: {(time.perf_counter() - start) * 1000:.1f}ms ({len(moved)} nodes moved)")
+
+
+if __name__ == '__main__':
+    main()
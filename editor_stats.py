@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from statistics import fmean
+from typing import Optional, Iterator
+
+__all__ = ['EditorStats']
+
+
+class EditorStats:
+    """ Collects responsiveness measurements of the node editor.
+
+    Timings are kept in fixed size windows so that the overhead stays constant no matter how long the editor runs.
+    Kivy is not imported here, the editor feeds the measurements in.
+    """
+
+    def __init__(self, log_path: Optional[str] = None, window: int = 240,
+                 max_bytes: int = 1 << 20, backup_count: int = 3):
+        self.frame_times: deque[float] = deque(maxlen=window)
+        self.touch_latencies: deque[float] = deque(maxlen=window)
+        self.render_times: deque[float] = deque(maxlen=window)
+        self.widget_count = 0
+        self.instruction_count = 0
+        self.logger = None
+        if log_path is not None:
+            self.logger = logging.getLogger(f"{__name__}.{id(self)}")
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+
+    def record_frame(self, dt: float):
+        self.frame_times.append(dt)
+
+    def record_touch(self, latency: float):
+        self.touch_latencies.append(latency)
+
+    def record_render(self, duration: float):
+        self.render_times.append(duration)
+
+    def record_counts(self, widgets: int, instructions: int):
+        self.widget_count = widgets
+        self.instruction_count = instructions
+
+    @contextmanager
+    def measure_render(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_render(time.perf_counter() - start)
+
+    def summary(self) -> dict[str, float]:
+        def ms(values, func):
+            return func(values) * 1000 if values else 0.0
+
+        return {
+            "fps": len(self.frame_times) / sum(self.frame_times) if sum(self.frame_times) else 0.0,
+            "frame_ms": ms(self.frame_times, fmean),
+            "frame_max_ms": ms(self.frame_times, max),
+            "touch_ms": ms(self.touch_latencies, fmean),
+            "touch_max_ms": ms(self.touch_latencies, max),
+            "render_ms": ms(self.render_times, fmean),
+            "render_max_ms": ms(self.render_times, max),
+            "widgets": self.widget_count,
+            "instructions": self.instruction_count,
+        }
+
+    def format_summary(self) -> str:
+        s = self.summary()
+        return (f"{s['fps']:.1f} fps, frame {s['frame_ms']:.2f}ms (max {s['frame_max_ms']:.2f}ms)\n"
+                f"touch {s['touch_ms']:.2f}ms (max {s['touch_max_ms']:.2f}ms)\n"
+                f"render_node {s['render_ms']:.2f}ms (max {s['render_max_ms']:.2f}ms)\n"
+                f"{s['widgets']} widgets, {s['instructions']} canvas instructions")
+
+    def log(self):
+        if self.logger is not None:
+            self.logger.info(" ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                                      for k, v in self.summary().items()))
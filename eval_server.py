@@ -0,0 +1,220 @@
+""" Local evaluation server for math graphs.
+
+    python eval_server.py [--host 127.0.0.1] [--port 8765] [--pool-size 64] [--fuse]
+
+Endpoints:
+    POST /graphs    body: graph json as written by `store_graph`, returns `{"graph_hash": ...}`
+    POST /evaluate  body: `{"graph": {...}} or {"graph_hash": ...}` plus `"batch": [{constant_id: value}, ...]`
+    GET  /metrics   latency and throughput since start
+
+`EvaluationService.handle` does all the work and can be used without any socket.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from statistics import fmean
+
+from math_nodes import Calculator, EvaluationPlan, get_node_type
+from nodes_interface import JSONData, load_graph
+
+__all__ = ['graph_hash', 'UnknownGraph', 'PlanPool', 'Metrics', 'EvaluationService', 'make_server']
+
+
+def graph_hash(graph: JSONData) -> str:
+    return hashlib.sha256(json.dumps(graph, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class UnknownGraph(LookupError):
+    """ No plan with the requested graph hash is pooled """
+
+
+class PlanPool:
+    """ LRU cache of compiled evaluation plans keyed by graph hash """
+
+    def __init__(self, capacity: int = 64, fuse: bool = False):
+        self.capacity = capacity
+        self.fuse = fuse
+        self._plans: OrderedDict[str, EvaluationPlan] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, graph: JSONData) -> tuple[str, EvaluationPlan]:
+        h = graph_hash(graph)
+        with self._lock:
+            if h in self._plans:
+                self._plans.move_to_end(h)
+                self.hits += 1
+                return h, self._plans[h]
+            self.misses += 1
+        nodes = load_graph(json.loads(json.dumps(graph)), get_node_type)
+        plan = Calculator(self.fuse).compile({node_id: nd for node_id, (nt, nd) in nodes.items()})
+        with self._lock:
+            self._plans[h] = plan
+            while len(self._plans) > self.capacity:
+                self._plans.popitem(last=False)
+        return h, plan
+
+    def get(self, h: str) -> EvaluationPlan:
+        with self._lock:
+            if h not in self._plans:
+                raise UnknownGraph(h)
+            plan = self._plans[h]
+            self._plans.move_to_end(h)
+            self.hits += 1
+            return plan
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+class Metrics:
+    def __init__(self, window: int = 1024):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.evaluations = 0
+        self.errors = 0
+        self.latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, evaluations: int, error: bool = False):
+        with self._lock:
+            self.requests += 1
+            self.evaluations += evaluations
+            self.errors += error
+            self.latencies.append(latency)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            uptime = time.perf_counter() - self.started
+
+            def quantile(q):
+                return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+
+            return {
+                "uptime_s": uptime,
+                "requests": self.requests,
+                "evaluations": self.evaluations,
+                "errors": self.errors,
+                "evaluations_per_s": self.evaluations / uptime if uptime else 0.0,
+                "latency_mean_ms": fmean(latencies) * 1000 if latencies else 0.0,
+                "latency_p50_ms": quantile(0.5),
+                "latency_p99_ms": quantile(0.99),
+                "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            }
+
+
+class EvaluationService:
+    def __init__(self, pool_size: int = 64, fuse: bool = False):
+        """ With `fuse`, `BinopNode` chains are fused and their inner outputs are not part of the returned values """
+        self.pool = PlanPool(pool_size, fuse)
+        self.metrics = Metrics()
+
+    def load_graph(self, graph: JSONData) -> str:
+        """ Compiles and pools `graph`, returns its hash """
+        start = time.perf_counter()
+        try:
+            h = self.pool.load(graph)[0]
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, 0, True)
+            raise
+        self.metrics.record(time.perf_counter() - start, 0)
+        return h
+
+    def handle(self, request: JSONData) -> JSONData:
+        """ Evaluates every entry of `request["batch"]` (default: one run without overrides) """
+        start = time.perf_counter()
+        evaluations = 0
+        try:
+            if "graph" in request:
+                h, plan = self.pool.load(request["graph"])
+            else:
+                h = request["graph_hash"]
+                plan = self.pool.get(h)
+            constants = plan.constants
+            results = []
+            for overrides in request.get("batch", [{}]):
+                unknown = set(overrides) - constants
+                if unknown:
+                    raise ValueError(f"Overrides for nodes that are no ConstantNode: {sorted(unknown)}")
+                sinks = {}
+                values = plan.run({k: float(v) for k, v in overrides.items()}, sinks)
+                results.append({
+                    "values": {f"{n}.{p}": v for (n, p), v in values.items()},
+                    "sinks": sinks,
+                })
+                evaluations += 1
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, evaluations, True)
+            raise
+        self.metrics.record(time.perf_counter() - start, evaluations)
+        return {"graph_hash": h, "results": results}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: EvaluationService
+
+    def _reply(self, status: int, data: JSONData):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._reply(200, {**self.service.metrics.snapshot(), "pooled_graphs": len(self.service.pool),
+                              "pool_hits": self.service.pool.hits, "pool_misses": self.service.pool.misses})
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path == "/graphs":
+                self._reply(200, {"graph_hash": self.service.load_graph(request)})
+            elif self.path == "/evaluate":
+                self._reply(200, self.service.handle(request))
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+        except UnknownGraph as e:
+            self._reply(404, {"error": f"Unknown graph_hash {e}"})
+        except Exception as e:
+            self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(service: EvaluationService, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pool-size", type=int, default=64)
+    parser.add_argument("--fuse", action="store_true", help="fuse BinopNode chains into single kernels")
+    args = parser.parse_args()
+    server = make_server(EvaluationService(args.pool_size, args.fuse), args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+""" Fusion of `BinopNode` chains into single kernels.
+
+Every `BinopNode` whose output only feeds one other `BinopNode` is merged into that consumer. The resulting expression
+tree is compiled once into a Python function, which removes the per node dispatch. Array inputs (numpy, only imported
+when arrays are passed) are evaluated with ufuncs writing into preallocated buffers, so a tree of any size allocates
+only its result.
+"""
+from __future__ import annotations
+
+import numbers
+import operator
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Union
+
+from math_nodes import MathNodeData, BinopNode
+from nodes_interface import *
+
+__all__ = ['FusedBinopNode', 'fuse_binops', 'compile_kernel']
+
+# ("in", index) for the inputs, (operator_name, left, right) for the operations
+Expression = Union[tuple[str, int], tuple[str, 'Expression', 'Expression']]
+
+MAX_DEPTH = 32
+
+_SYMBOLS = {"add": "+", "sub": "-", "mul": "*", "truediv": "/"}
+_UFUNCS = {"add": "add", "sub": "subtract", "mul": "multiply", "truediv": "true_divide"}
+
+
+def _source(expr: Expression) -> str:
+    if expr[0] == "in":
+        return f"v{expr[1]}"
+    op, left, right = expr
+    if op in _SYMBOLS:
+        return f"({_source(left)} {_SYMBOLS[op]} {_source(right)})"
+    return f"_op_{op}({_source(left)}, {_source(right)})"
+
+
+def _operators(expr: Expression) -> set[str]:
+    if expr[0] == "in":
+        return set()
+    return {expr[0]} | _operators(expr[1]) | _operators(expr[2])
+
+
+class _ArrayKernel:
+    """ Runs an expression as a sequence of ufunc calls, temporaries live in per thread buffers kept by shape and dtype
+
+    The dtype of every step follows the ufunc rules of numpy, so integer arrays stay integer until a division.
+    """
+
+    def __init__(self, expr: Expression):
+        self.program: list[tuple[str, Any, Any, Any]] = []
+        self.registers = 0
+        free: list[int] = []
+
+        def emit(e: Expression, root: bool):
+            if e[0] == "in":
+                return "in", e[1]
+            a = emit(e[1], False)
+            b = emit(e[2], False)
+            for operand in (a, b):
+                if operand[0] == "reg":
+                    free.append(operand[1])
+            if root:
+                out = ("out", 0)
+            elif free:
+                out = ("reg", free.pop())
+            else:
+                out = ("reg", self.registers)
+                self.registers += 1
+            self.program.append((_UFUNCS[e[0]], a, b, out))
+            return out
+
+        emit(expr, True)
+        self._dtypes: dict[tuple, list] = {}
+        self._local = threading.local()
+
+    def _step_dtypes(self, values: tuple) -> list:
+        """ Output dtype of every step, found by running the program once on samples of the inputs """
+        import numpy as np
+        key = tuple(getattr(v, "dtype", type(v)) for v in values)
+        dtypes = self._dtypes.get(key)
+        if dtypes is None:
+            # Python scalars are kept as they are, numpy treats them as weakly typed
+            samples = [np.ones(1, v.dtype) if isinstance(v, np.ndarray) else v for v in values]
+            regs = {}
+            dtypes = []
+            with np.errstate(all="ignore"):
+                for ufunc, a, b, o in self.program:
+                    r = getattr(np, ufunc)(*(samples[x[1]] if x[0] == "in" else regs[x[1]] for x in (a, b)))
+                    regs[o[1]] = r
+                    dtypes.append(np.result_type(r))
+            self._dtypes[key] = dtypes
+        return dtypes
+
+    def __call__(self, *values):
+        import numpy as np
+        shape = np.broadcast_shapes(*(np.shape(v) for v in values))
+        dtypes = self._step_dtypes(values)
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        out = np.empty(shape, dtypes[-1])
+
+        def load(operand, dtype=None):
+            kind, i = operand
+            if kind == "in":
+                return values[i]
+            if kind == "out":
+                return out
+            if dtype is None:
+                return buffers[shape, i, current[i]]
+            current[i] = dtype
+            key = shape, i, dtype
+            if key not in buffers:
+                buffers[key] = np.empty(shape, dtype)
+            return buffers[key]
+
+        current = {}
+        for (ufunc, a, b, o), dtype in zip(self.program, dtypes):
+            getattr(np, ufunc)(load(a), load(b), out=load(o, dtype))
+        return out
+
+
+def compile_kernel(expr: Expression, arity: int) -> Callable[..., Any]:
+    """ Returns a function of `arity` values evaluating `expr` in one call """
+    params = ", ".join(f"v{i}" for i in range(arity))
+    namespace = {f"_op_{op}": getattr(operator, op) for op in _operators(expr)}
+    exec(f"def scalar_kernel({params}):\n    return {_source(expr)}\n", namespace)
+    scalar_kernel = namespace["scalar_kernel"]
+    if not _operators(expr) <= set(_UFUNCS):
+        return scalar_kernel
+    array_kernel = _ArrayKernel(expr)
+
+    def kernel(*values):
+        if all(isinstance(v, numbers.Number) for v in values):
+            return scalar_kernel(*values)
+        return array_kernel(*values)
+
+    return kernel
+
+
+@dataclass
+class FusedBinopNode(MathNodeData):
+    """ Stands in for a tree of `BinopNode`s during evaluation, `id` is the one of the root of the tree """
+    id: str
+    expression: Expression
+    pins: dict[str, NodePin]
+    fused_ids: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.kernel = compile_kernel(self.expression, len(self.inputs))
+
+    def calc(self, values: list[float]) -> list[float]:
+        return [self.kernel(*values)]
+
+
+def _source_of(node: BinopNode, pin_id: str) -> tuple[str, str]:
+    return tuple(node.pins[pin_id].target_ids[0])
+
+
+def fuse_binops(nodes: dict[str, MathNodeData]) -> dict[str, MathNodeData]:
+    """ Returns a copy of `nodes` where each tree of single consumer `BinopNode`s is replaced by a `FusedBinopNode`.
+
+    The result is meant for evaluation only, the pins of the nodes outside the trees still name the fused nodes.
+    """
+
+    def complete(node: MathNodeData) -> bool:
+        return isinstance(node, BinopNode) and all(len(p.target_ids) == 1 for p in node.inputs.values())
+
+    merged = set()
+    for node_id, node in nodes.items():
+        if not complete(node):
+            continue
+        targets = node.pins["out"].target_ids
+        if len(targets) == 1 and targets[0][0] in nodes and targets[0][0] != node_id \
+                and complete(nodes[targets[0][0]]):
+            merged.add(node_id)
+
+    result = {}
+    covered = set()
+    pending = [node_id for node_id in nodes if node_id not in merged]
+
+    def fuse(root: MathNodeData):
+        if not complete(root) or not any(_source_of(root, p)[0] in merged for p in root.inputs):
+            result[root.id] = root
+            return
+        leaves: dict[tuple[str, str], int] = {}
+        fused_ids = []
+
+        def build(binop: BinopNode, depth: int) -> Expression:
+            fused_ids.append(binop.id)
+            operands = []
+            for pin_id in binop.inputs:
+                source = _source_of(binop, pin_id)
+                if source[0] in merged and depth < MAX_DEPTH:
+                    operands.append(build(nodes[source[0]], depth + 1))
+                else:
+                    if source[0] in merged:
+                        # Too deep to compile in one piece, the subtree becomes a kernel of its own
+                        pending.append(source[0])
+                    operands.append(("in", leaves.setdefault(source, len(leaves))))
+            return binop.operator_name, *operands
+
+        expression = build(root, 0)
+        pins = {f"in{i}": NodePin(f"in{i}", False, "in", float, [source]) for source, i in leaves.items()}
+        out = root.pins["out"]
+        pins["out"] = NodePin("out", out.multi_connect, out.io, out.type, list(out.target_ids))
+        result[root.id] = FusedBinopNode(root.id, expression, pins, fused_ids)
+        covered.update(fused_ids)
+
+    while pending:
+        fuse(nodes[pending.pop()])
+    for node_id, node in nodes.items():
+        if node_id not in result and node_id not in covered:
+            # Only part of a cycle, left to the evaluation to report
+            result[node_id] = node
+    return result
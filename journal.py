@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Callable, Optional, Any, TextIO
+
+from node_registry import NodeRegistry
+from nodes_interface import *
+
+__all__ = ['EditJournal']
+
+# Record layouts, one JSON array per line:
+#   ["c", type_id, node_json]                              create
+#   ["d", node_id]                                         delete
+#   ["+", start_id, start_pin, end_id, end_pin]            connect
+#   ["-", start_id, start_pin, end_id, end_pin]            disconnect
+#   ["s", node_id, parameter, value]                       set parameter
+# The first line is a header `{"generation": n}` naming the snapshot the records apply to.
+
+
+def _dump(data: JSONData) -> str:
+    return json.dumps(data, separators=(',', ':'))
+
+
+class EditJournal:
+    """ Append-only journal of the edits made through a `NodeRegistry` and a `NodeProvider`.
+
+    Every edit appends one record, so saving costs O(edit). After `compact_every` records the whole graph is
+    written to a snapshot and the journal starts over, which bounds the time `replay` takes after a crash.
+    """
+
+    snapshot_name = "snapshot.json"
+    journal_name = "journal.jsonl"
+
+    def __init__(self, directory: str, compact_every: int = 1000, fsync: bool = False):
+        self.directory = directory
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.generation = 0
+        self.records = 0
+        self.registry: Optional[NodeRegistry] = None
+        self.provider: Optional[NodeProvider] = None
+        self._file: Optional[TextIO] = None
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, self.snapshot_name)
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.directory, self.journal_name)
+
+    def open(self, registry: NodeRegistry, provider: NodeProvider, node_types: Callable[[str], NodeType]) -> int:
+        """ Replays the stored state into `registry` and starts recording, returns the number of replayed records """
+        replayed = self.replay(registry, provider, node_types)
+        self.attach(registry, provider)
+        return replayed
+
+    def replay(self, registry: NodeRegistry, provider: NodeProvider, node_types: Callable[[str], NodeType]) -> int:
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            self.generation = snapshot["generation"]
+            registry.add_many(load_graph(snapshot["nodes"], node_types).values())
+        if self._journal_generation() != self.generation:
+            # Either empty or already contained in the snapshot (crash during compaction)
+            return 0
+        replayed = 0
+        with open(self.journal_path, "rb+") as f:
+            good = len(f.readline())
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Incomplete record")
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash in the middle of a write leaves a partial last line behind
+                    f.truncate(good)
+                    break
+                self._apply(record, registry, provider, node_types)
+                good += len(line)
+                replayed += 1
+        self.records = replayed
+        return replayed
+
+    def _journal_generation(self) -> Optional[int]:
+        try:
+            with open(self.journal_path, "rb") as f:
+                return json.loads(f.readline())["generation"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def _apply(record: list, registry: NodeRegistry, provider: NodeProvider, node_types: Callable[[str], NodeType]):
+        op, *args = record
+        if op == "c":
+            type_id, data = args
+            nt = node_types(type_id)
+            registry.add(nt, nt.load_json(data))
+        elif op == "d":
+            del registry[args[0]]
+        elif op in ("+", "-"):
+            start_id, start_pin, end_id, end_pin = args
+            start = registry[start_id][1], start_pin
+            end = registry[end_id][1], end_pin
+            if op == "+":
+                provider.connect(start, end)
+            else:
+                provider.disconnect(start, end)
+        elif op == "s":
+            node_id, name, value = args
+            nt, node = registry[node_id][:2]
+            provider.set_parameter(nt, node, name, value)
+        else:
+            raise ValueError(f"Unknown journal record {record!r}")
+
+    def attach(self, registry: NodeRegistry, provider: NodeProvider):
+        self.registry = registry
+        self.provider = provider
+        if self._journal_generation() == self.generation:
+            self._file = open(self.journal_path, "a")
+        else:
+            self._start_journal()
+        registry.listeners.append(self._on_registry)
+        provider.listeners.append(self._on_provider)
+
+    def detach(self):
+        self.registry.listeners.remove(self._on_registry)
+        self.provider.listeners.remove(self._on_provider)
+        self._file.close()
+        self._file = None
+
+    def _flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _write(self, records: list[list[Any]]):
+        self._file.write("".join(_dump(r) + "\n" for r in records))
+        self._flush()
+        self.records += len(records)
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def _on_registry(self, registry: NodeRegistry, added: dict[str, tuple], removed: dict[str, tuple]):
+        self._write([["d", node_id] for node_id in removed]
+                    + [["c", entry[0].id, entry[1].to_json()] for entry in added.values()])
+
+    def _on_provider(self, event: str, *args):
+        if event == "set":
+            (node, name), value = args
+            self._write([["s", node.id, name, value]])
+        else:
+            (start, start_pin), (end, end_pin) = args
+            self._write([["+" if event == "connect" else "-", start.id, start_pin, end.id, end_pin]])
+
+    def compact(self):
+        """ Writes the full graph to the snapshot and starts a new, empty journal """
+        generation = self.generation + 1
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(_dump({"generation": generation, "nodes": store_graph(self.registry)}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        self.generation = generation
+        self._file.close()
+        self._start_journal()
+
+    def _start_journal(self):
+        self._file = open(self.journal_path, "w")
+        self._file.write(_dump({"generation": self.generation}) + "\n")
+        self._flush()
+        self.records = 0
@@ -0,0 +1,219 @@
+""" Layered (Sugiyama style) automatic layout working on the connections stored in `NodePin.target_ids`.
+
+Positions are the centers of the nodes, layers go from left to right following the connections.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from collections import deque
+from collections.abc import Mapping, Iterable
+
+from nodes_interface import NodeData
+
+__all__ = ['layered_layout', 'LayerOccupancy', 'relayout']
+
+Position = tuple[float, float]
+
+
+def _neighbours(nodes: Mapping[str, NodeData], node_id: str, io: str) -> list[str]:
+    """ Nodes connected to an `io` pin of `node_id`, both ends store a connection so this is local """
+    other_io = "in" if io == "out" else "out"
+    result = {}
+    for pin in nodes[node_id].pins.values():
+        if io not in pin.io:
+            continue
+        for other_id, other_pin in pin.target_ids:
+            if other_id != node_id and other_id in nodes and other_io in nodes[other_id].pins[other_pin].io:
+                result[other_id] = None
+    return list(result)
+
+
+def _edges(nodes: Mapping[str, NodeData]) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    succs = {node_id: _neighbours(nodes, node_id, "out") for node_id in nodes}
+    preds = {node_id: [] for node_id in nodes}
+    for node_id, ss in succs.items():
+        for s in ss:
+            preds[s].append(node_id)
+    return succs, preds
+
+
+def _topological_order(node_ids: Iterable[str], succs: dict[str, list[str]]) -> list[str]:
+    """ Reverse DFS postorder, edges closing a cycle are ignored """
+    order = []
+    state = {}
+    for root in node_ids:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(succs[root]))]
+        while stack:
+            node_id, it = stack[-1]
+            for s in it:
+                if s not in state and s in succs:
+                    state[s] = 1
+                    stack.append((s, iter(succs[s])))
+                    break
+            else:
+                state[node_id] = 2
+                order.append(node_id)
+                stack.pop()
+    order.reverse()
+    return order
+
+
+def _assign_layers(order: list[str], preds: dict[str, list[str]]) -> dict[str, int]:
+    index = {node_id: i for i, node_id in enumerate(order)}
+    layers = {}
+    for node_id in order:
+        # Predecessors later in the order are connected through a cycle
+        layers[node_id] = max((layers[p] + 1 for p in preds[node_id] if index.get(p, len(order)) < index[node_id]),
+                              default=0)
+    return layers
+
+
+def _reduce_crossings(rows: list[list[str]], succs: dict[str, list[str]], preds: dict[str, list[str]],
+                      sweeps: int):
+    position = {node_id: i for row in rows for i, node_id in enumerate(row)}
+
+    def sort_row(row: list[str], neighbours: dict[str, list[str]]):
+        def key(node_id):
+            ns = neighbours[node_id]
+            return (sum(position[n] for n in ns) / len(ns) if ns else position[node_id]), position[node_id]
+
+        row.sort(key=key)
+        for i, node_id in enumerate(row):
+            position[node_id] = i
+
+    for sweep in range(sweeps):
+        if sweep % 2 == 0:
+            for row in rows[1:]:
+                sort_row(row, preds)
+        else:
+            for row in reversed(rows[:-1]):
+                sort_row(row, succs)
+
+
+def layered_layout(nodes: Mapping[str, NodeData], layer_spacing: float = 220, node_spacing: float = 120,
+                   sweeps: int = 4) -> dict[str, Position]:
+    """ Positions every node, O((n + e) log n) for a fixed number of crossing reduction `sweeps` """
+    succs, preds = _edges(nodes)
+    layers = _assign_layers(_topological_order(nodes, succs), preds)
+    rows = [[] for _ in range(max(layers.values(), default=-1) + 1)]
+    for node_id, layer in layers.items():
+        rows[layer].append(node_id)
+    _reduce_crossings(rows, succs, preds, sweeps)
+    positions = {}
+    for layer, row in enumerate(rows):
+        top = (len(row) - 1) * node_spacing / 2
+        for i, node_id in enumerate(row):
+            positions[node_id] = (layer * layer_spacing, top - i * node_spacing)
+    return positions
+
+
+class _LocalNeighbours(dict):
+    """ Neighbours looked up on demand, so `relayout` does not walk the whole graph """
+
+    def __init__(self, nodes: Mapping[str, NodeData], io: str):
+        super().__init__()
+        self.nodes = nodes
+        self.io = io
+
+    def __missing__(self, node_id: str) -> list[str]:
+        result = self[node_id] = _neighbours(self.nodes, node_id, self.io)
+        return result
+
+
+class LayerOccupancy:
+    """ The y coordinates taken in every layer, kept sorted so `relayout` finds free slots without a scan """
+
+    def __init__(self, layer_spacing: float = 220):
+        self.layer_spacing = layer_spacing
+        self._positions: dict[str, Position] = {}
+        self._layers: dict[int, list[float]] = {}
+
+    def layer_of(self, pos: Position) -> int:
+        return round(pos[0] / self.layer_spacing)
+
+    def set(self, node_id: str, pos: Position):
+        self.discard(node_id)
+        self._positions[node_id] = pos
+        insort(self._layers.setdefault(self.layer_of(pos), []), pos[1])
+
+    def discard(self, node_id: str):
+        pos = self._positions.pop(node_id, None)
+        if pos is not None:
+            ys = self._layers[self.layer_of(pos)]
+            del ys[bisect_left(ys, pos[1])]
+
+    def ys(self, layer: int) -> list[float]:
+        return self._layers.get(layer, [])
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+
+def relayout(nodes: Mapping[str, NodeData], positions: Mapping[str, Position], changed: Iterable[str],
+             radius: int = 1, layer_spacing: float = 220, node_spacing: float = 120,
+             occupancy: LayerOccupancy = None) -> dict[str, Position]:
+    """ Places the `changed` nodes and their neighbours up to `radius` connections away, all others stay fixed.
+
+    Only the new positions of the moved nodes are returned. Without an `occupancy` of the current `positions` one
+    is built first, which costs O(n log n); with it the cost only depends on the size of the moved region, and the
+    occupancy is updated to the returned positions.
+    """
+    succs = _LocalNeighbours(nodes, "out")
+    preds = _LocalNeighbours(nodes, "in")
+    region = {node_id for node_id in changed if node_id in nodes}
+    frontier = deque((node_id, 0) for node_id in region)
+    while frontier:
+        node_id, distance = frontier.popleft()
+        if distance == radius:
+            continue
+        for n in (*succs[node_id], *preds[node_id]):
+            if n not in region:
+                region.add(n)
+                frontier.append((n, distance + 1))
+
+    if occupancy is None:
+        occupancy = LayerOccupancy(layer_spacing)
+        for node_id, pos in positions.items():
+            occupancy.set(node_id, pos)
+    for node_id in region:
+        occupancy.discard(node_id)
+    layer_of = occupancy.layer_of
+
+    def is_fixed(node_id: str) -> bool:
+        return node_id not in region and node_id in positions
+
+    def free_slot(layer: int, y: float) -> float:
+        ys = occupancy.ys(layer)
+        y = round(y / node_spacing) * node_spacing
+        for step in range(len(ys) + 1):
+            for candidate in ((y + step * node_spacing, y - step * node_spacing) if step else (y,)):
+                i = bisect_left(ys, candidate - node_spacing + 1e-9)
+                if i == len(ys) or ys[i] >= candidate + node_spacing - 1e-9:
+                    return candidate
+        raise AssertionError("unreachable")
+
+    sub_succs = {node_id: [s for s in succs[node_id] if s in region] for node_id in region}
+    order = _topological_order(sorted(region), sub_succs)
+    index = {node_id: i for i, node_id in enumerate(order)}
+    result = {}
+    for node_id in order:
+        ps = [p for p in preds[node_id] if is_fixed(p) or index.get(p, len(order)) < index[node_id]]
+        if ps:
+            layer = max(layer_of(result.get(p) or positions[p]) for p in ps) + 1
+        else:
+            fixed_succs = [layer_of(positions[s]) for s in succs[node_id] if is_fixed(s)]
+            layer = max(min(fixed_succs) - 1, 0) if fixed_succs else 0
+        placed = [n for n in (*preds[node_id], *succs[node_id]) if is_fixed(n) or n in result]
+        if placed:
+            y = sum((result.get(n) or positions[n])[1] for n in placed) / len(placed)
+        else:
+            y = positions[node_id][1] if node_id in positions else 0.0
+        result[node_id] = (layer * layer_spacing, free_slot(layer, y))
+        occupancy.set(node_id, result[node_id])
+    return result
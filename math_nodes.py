@@ -1,6 +1,7 @@
 import operator
 from abc import abstractmethod, ABC
 from dataclasses import dataclass, field
+from functools import cached_property
 from typing import Optional, Callable, Any
 
 from nodes_interface import *
@@ -45,6 +46,40 @@ class MathNodeType(NodeType):
 
 
 MATH_NODE_TYPES = {}
+PLUGIN_GROUP = "nodeeditor.math_nodes"
+_plugins_loaded = False
+
+
+def load_plugins():
+    """ Registers the node types of the `nodeeditor.math_nodes` entry points, only the first call does any work.
+
+    An entry point can either refer to a `MathNodeData` subclass or a `MathNodeType`.
+    """
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    from importlib.metadata import entry_points
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=PLUGIN_GROUP)
+    else:
+        # Python < 3.10 returns a dict of groups
+        eps = eps.get(PLUGIN_GROUP, [])
+    for ep in eps:
+        obj = ep.load()
+        if isinstance(obj, MathNodeType):
+            MATH_NODE_TYPES[obj.id] = obj
+        else:
+            _register(obj)
+    _plugins_loaded = True
+
+
+def get_node_type(type_id: str) -> MathNodeType:
+    try:
+        return MATH_NODE_TYPES[type_id]
+    except KeyError:
+        load_plugins()
+        return MATH_NODE_TYPES[type_id]
 
 
 def _register(cls):
@@ -111,39 +146,75 @@ class BinopNode(MathNodeData):
 
 class MathNodeProvider(NodeProvider[MathNodeData]):
     def node_types(self) -> list[NodeType[MathNodeData]]:
+        load_plugins()
         return list(MATH_NODE_TYPES.values())
 
 
+@dataclass
+class EvaluationStep:
+    node_id: str
+    node: MathNodeData
+    inputs: list[tuple[str, str]]
+    outputs: list[str]
+
+
+@dataclass
+class EvaluationPlan:
+    """ The nodes of a graph in topological order, with their input and output keys resolved once """
+    steps: list[EvaluationStep]
+
+    @cached_property
+    def constants(self) -> set[str]:
+        return {s.node_id for s in self.steps if isinstance(s.node, ConstantNode)}
+
+    def run(self, overrides: dict[str, float] = None,
+            sinks: dict[str, list[float]] = None) -> dict[tuple[str, str], float]:
+        """ Evaluates the graph, returning the value of every output pin.
+
+        `overrides` replaces the value of `ConstantNode`s by id. If `sinks` is given, the inputs of nodes without
+        outputs (e.g. `PrinterNode`) are stored there instead of calling them.
+        """
+        values = {}
+        for step in self.steps:
+            if overrides is not None and step.node_id in overrides:
+                outs = [overrides[step.node_id]]
+            else:
+                ins = [values[t] for t in step.inputs]
+                if sinks is not None and not step.outputs:
+                    sinks[step.node_id] = ins
+                    continue
+                outs = step.node.calc(ins)
+            for p, v in zip(step.outputs, outs):
+                values[(step.node_id, p)] = v
+        return values
+
+
 class Calculator:
-    def __init__(self):
-        pass
+    def __init__(self, fuse: bool = False):
+        self.fuse = fuse
 
-    def evaluate(self, nodes: dict[str, MathNodeData]):
+    def compile(self, nodes: dict[str, MathNodeData]) -> EvaluationPlan:
+        if self.fuse:
+            from fusion import fuse_binops
+            nodes = fuse_binops(nodes)
         sorter = TopologicalSorter()
         for name, node in nodes.items():
             sorter.add(name, *(tn for pn, p in node.inputs.items() for tn, tp in p.target_ids))
-        sorter.prepare()
-        values = {}
-        while sorter.is_active():
-            for name in sorter.get_ready():
-                node = nodes[name]
-                ins = [values[t] for pn, p in node.inputs.items() for t in p.target_ids]
-                outs = node.calc(ins)
-                for p, v in zip(node.outputs, outs):
-                    values[(name, p)] = v
-                sorter.done(name)
-
+        return EvaluationPlan([
+            EvaluationStep(
+                name,
+                nodes[name],
+                [tuple(t) for pn, p in nodes[name].inputs.items() for t in p.target_ids],
+                list(nodes[name].outputs)
+            )
+            for name in sorter.static_order()
+        ])
 
-if __name__ == '__main__':
-    from node_cmd import NodeCmd
+    def evaluate(self, nodes: dict[str, MathNodeData]) -> dict[tuple[str, str], float]:
+        return self.compile(nodes).run()
 
 
-    class MathCmd(NodeCmd):
-        def do_evaluate(self, arg):
-            calc = Calculator()
-            calc.evaluate({s: nd for s, (nt, nd) in self.nodes.items()})
-
-    DEFAULT = """
+DEFAULT = """
 create v1 ConstantNode 5
 create v2 ConstantNode 7
 create a1 BinopNode add
@@ -159,5 +230,30 @@ connect a1.out p1.in
 connect s1.out p1.in 
 """
 
+
+def main(journal_dir: Optional[str] = None):
+    """ Headless entry point, only imports the command line interface """
+    from node_cmd import NodeCmd
+
+    class MathCmd(NodeCmd):
+        def do_evaluate(self, arg):
+            calc = Calculator()
+            calc.evaluate({s: nd for s, (nt, nd) in self.nodes.items()})
+
     nc = MathCmd(MathNodeProvider())
-    nc.cmdloop()
+    if journal_dir is not None:
+        from journal import EditJournal
+        journal = EditJournal(journal_dir)
+        journal.open(nc.nodes, nc.provider, get_node_type)
+        try:
+            nc.cmdloop()
+        finally:
+            journal.detach()
+    else:
+        nc.cmdloop()
+
+
+if __name__ == '__main__':
+    import sys
+
+    main(*sys.argv[1:2])
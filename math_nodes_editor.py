@@ -1,7 +1,10 @@
+import os
+
 from kivy.lang import Builder
 from kivy.uix.label import Label
 from kivy.uix.widget import Widget
 
+from editor_stats import EditorStats
 from math_nodes import MathNodeProvider
 from nodeeditor import NodeEditorApp, NodeRenderer
 from nodes_interface import NodePin, NodeType, ND
@@ -19,6 +22,12 @@ class MathNodeRenderer(NodeRenderer):
         return PinCircle(size=(10, 10))
 
 
-Builder.load_file("math_nodes_editor.kv")
-math_app = NodeEditorApp(MathNodeProvider(), MathNodeRenderer())
-math_app.run()
+def main():
+    Builder.load_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "math_nodes_editor.kv"))
+    stats = EditorStats(os.environ["NODEEDITOR_STATS"]) if os.environ.get("NODEEDITOR_STATS") else None
+    math_app = NodeEditorApp(MathNodeProvider(), MathNodeRenderer(), stats)
+    math_app.run()
+
+
+if __name__ == '__main__':
+    main()
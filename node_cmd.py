@@ -1,10 +1,14 @@
 import sys
 import traceback
 from cmd import Cmd
+from functools import lru_cache
 from shlex import split
 from typing import Callable, Literal
 
+from node_registry import NodeRegistry
 from nodes_interface import *
+from pin_index import PinIndex
+from prefix_index import PrefixIndex
 
 
 def print_table(entries: list[tuple[str, ...]], header: tuple[str, ...] = None, sep='', pad=' ', file=sys.stdout):
@@ -40,17 +44,26 @@ def format_pins(pins: dict[str, NodePin]):
     return '{' + ', '.join(f"{n}: {_format_pin(p)}" for n, p in pins.items()) + '}'
 
 
+@lru_cache(maxsize=64)
+def _split_prefix(line: str) -> tuple[str, ...]:
+    return tuple(split(line))
+
+
 class NodeCmd(Cmd):
     node_types: dict[str, NodeType]
-    nodes: dict[str, tuple[NodeType, NodeData]]
+    nodes: NodeRegistry[tuple[NodeType, NodeData]]
 
     prompt = "> "
 
-    def __init__(self, provider: NodeProvider, **kwargs):
+    def __init__(self, provider: NodeProvider, registry: NodeRegistry = None, **kwargs):
         super(NodeCmd, self).__init__(**kwargs)
         self.provider = provider
         self.node_types = {t.id: t for t in sorted(self.provider.node_types(), key=lambda t: (t.category, t.id))}
-        self.nodes = {}
+        self.nodes = registry if registry is not None else NodeRegistry()
+        self.pins = PinIndex(self.nodes, self.provider)
+        self.node_ids = PrefixIndex()
+        self.node_ids.follow(self.nodes)
+        self.type_ids = PrefixIndex(self.node_types)
 
     def onecmd(self, line: str) -> bool:
         try:
@@ -111,24 +124,26 @@ class NodeCmd(Cmd):
         self.print_nodes()
 
     def do_create(self, arg):
-        """ create <id> <type> <arguments...>
-        Creates a node
+        """ create <id|-> <type> <arguments...>
+        Creates a node, `-` allocates the next free id
         """
         new_id, types, *args = split(arg)
-        if new_id in self.node_types:
+        if new_id == "-":
+            new_id = self.nodes.new_id()
+        elif new_id in self.nodes:
             raise ValueError(f"{new_id} already defined")
         nt = self.node_types[types]
         if len(args) > len(nt.parameters):
             raise ValueError(f"To many arguments (expected at most {len(nt.parameters)})")
-        self.nodes[new_id] = nt, nt.create(new_id, {
+        self.nodes.add(nt, nt.create(new_id, {
             n: self.parseparameter(p, v)
             for (n, p), v in zip(nt.parameters.items(), args)
-        })
+        }))
 
     def complete_create(self, text, line, begidx, endidx):
-        args = split(line[:begidx])
+        args = _split_prefix(line[:begidx])
         if len(args) == 2:
-            return [n for n in self.node_types if n.startswith(text)]
+            return self.type_ids.complete(text)
         elif len(args) >= 2:
             try:
                 nt = self.node_types[args[2]]
@@ -141,32 +156,73 @@ class NodeCmd(Cmd):
         else:
             return []
 
+    def do_delete(self, arg):
+        """ delete <id>
+        Disconnects and deletes a node
+        """
+        node_id, = split(arg)
+        node = self.nodes[node_id][1]
+        for pin_id, pin in node.pins.items():
+            for other_id, other_pin in list(pin.target_ids):
+                other = self.nodes[other_id][1], other_pin
+                if "out" in pin.io:
+                    self.provider.disconnect((node, pin_id), other)
+                else:
+                    self.provider.disconnect(other, (node, pin_id))
+        del self.nodes[node_id]
+
+    def complete_delete(self, text, line, begidx, endidx):
+        return self.node_ids.complete(text)
+
+    def do_set(self, arg):
+        """ set <id> <parameter> <value>
+        Changes a parameter of a node
+        """
+        node_id, name, value = split(arg)
+        nt, node = self.nodes[node_id][:2]
+        self.provider.set_parameter(nt, node, name, self.parseparameter(nt.parameters[name], value))
+
     def do_connect(self, arg):
+        """ connect <id>.<pin> <id>.<pin>
+        Connects an output pin to an input pin
+        """
+        (src_node, src_pin), (tar_node, tar_pin) = self._parse_connection(arg)
+        assert self.provider.is_compatible((src_node, src_pin), (tar_node, tar_pin))
+        self.provider.connect((src_node, src_pin), (tar_node, tar_pin))
+
+    def do_disconnect(self, arg):
+        """ disconnect <id>.<pin> <id>.<pin>
+        Removes a connection made with connect
+        """
+        self.provider.disconnect(*self._parse_connection(arg))
+
+    def _parse_connection(self, arg) -> tuple[tuple[NodeData, str], tuple[NodeData, str]]:
         source, target = split(arg)
         src_node, src_pin = source.split(".")
         tar_node, tar_pin = target.split(".")
-        src_node = self.nodes[src_node][1]
-        tar_node = self.nodes[tar_node][1]
-        assert self.provider.is_compatible((src_node, src_pin), (tar_node, tar_pin))
-        self.provider.connect((src_node, src_pin), (tar_node, tar_pin))
+        return (self.nodes[src_node][1], src_pin), (self.nodes[tar_node][1], tar_pin)
 
-    def _complete_pin(self, prefix: str, mode: Literal["in", "out"]):
+    def _complete_pin(self, prefix: str, mode: Literal["in", "out"], source: tuple[str, str] = None):
         if "." in prefix:
-            src_node_name, pin_prefix = prefix.split(".")
-            src_node = self.nodes[src_node_name][1]
-            return [f"{src_node_name}.{p}"
-                    for pin_name, pin in src_node.pins
-                    if pin_name.startswith(pin_prefix) and mode in pin.io]
+            node_name, pin_prefix = prefix.split(".")
+            node = self.nodes[node_name][1]
+            src = (self.nodes[source[0]][1], source[1]) if source is not None else None
+            return [f"{node_name}.{pin_name}"
+                    for pin_name in node.pins
+                    if pin_name.startswith(pin_prefix) and self.pins.is_free(node_name, pin_name, mode)
+                    and (src is None or self.provider.is_compatible(src, (node, pin_name)))]
+        elif source is not None:
+            return self.pins.compatible_nodes(source[0], source[1], prefix)
         else:
-            return [n for n in self.nodes if n.startswith(prefix)]
+            return self.node_ids.complete(prefix)
 
     def complete_connect(self, text, line, begidx, endidx):
         try:
-            args = split(line[:begidx])
+            args = _split_prefix(line[:begidx])
             if len(args) == 1:
                 return self._complete_pin(text, "out")
             elif len(args) == 2:
-                return self._complete_pin(text, "in")
+                return self._complete_pin(text, "in", tuple(args[1].split(".")))
             else:
                 return []
         except Exception as e:
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from collections.abc import MutableMapping, Iterable, Iterator
+from typing import Callable, Generic, TypeVar
+
+from nodes_interface import *
+
+__all__ = ['NodeRegistry', 'RegistryListener']
+
+E = TypeVar('E', bound=tuple)
+
+RegistryListener = Callable[['NodeRegistry', dict[str, tuple], dict[str, tuple]], None]
+
+
+class NodeRegistry(MutableMapping[str, E], Generic[E]):
+    """ Mapping of node id to an entry tuple whose first two items are the `NodeType` and the `NodeData`.
+
+    Further items are free for the user (e.g. the widget in the editor). Listeners are called with
+    `(registry, added, removed)` once per operation, bulk operations included.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, E] = {}
+        self._by_type: dict[str, dict[str, None]] = {}
+        self._next_id = 1
+        self.listeners: list[RegistryListener] = []
+
+    def new_id(self) -> str:
+        while str(self._next_id) in self._entries:
+            self._next_id += 1
+        return str(self._next_id)
+
+    def _insert(self, node_id: str, entry: E):
+        if node_id in self._entries:
+            raise ValueError(f"{node_id} already defined")
+        if entry[1].id != node_id:
+            raise ValueError(f"Node id {entry[1].id!r} does not match registry key {node_id!r}")
+        self._entries[node_id] = entry
+        self._by_type.setdefault(entry[0].id, {})[node_id] = None
+        if node_id.isdigit() and int(node_id) >= self._next_id:
+            self._next_id = int(node_id) + 1
+
+    def _delete(self, node_id: str) -> E:
+        entry = self._entries.pop(node_id)
+        del self._by_type[entry[0].id][node_id]
+        return entry
+
+    def _notify(self, added: dict[str, E], removed: dict[str, E]):
+        for listener in list(self.listeners):
+            listener(self, added, removed)
+
+    def add(self, node_type: NodeType, node_data: NodeData, *extra) -> str:
+        entry = (node_type, node_data, *extra)
+        node_id = node_data.id
+        self._insert(node_id, entry)
+        self._notify({node_id: entry}, {})
+        return node_id
+
+    def add_many(self, entries: Iterable[E]):
+        added = {}
+        try:
+            for entry in entries:
+                self._insert(entry[1].id, entry)
+                added[entry[1].id] = entry
+        finally:
+            if added:
+                self._notify(added, {})
+
+    def remove_many(self, node_ids: Iterable[str]) -> dict[str, E]:
+        removed = {}
+        try:
+            for node_id in node_ids:
+                removed[node_id] = self._delete(node_id)
+        finally:
+            if removed:
+                self._notify({}, removed)
+        return removed
+
+    def of_type(self, type_id: str) -> list[E]:
+        return [self._entries[i] for i in self._by_type.get(type_id, ())]
+
+    def __getitem__(self, node_id: str) -> E:
+        return self._entries[node_id]
+
+    def __setitem__(self, node_id: str, entry: E):
+        removed = {node_id: self._delete(node_id)} if node_id in self._entries else {}
+        self._insert(node_id, entry)
+        self._notify({node_id: entry}, removed)
+
+    def __delitem__(self, node_id: str):
+        self.remove_many((node_id,))
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
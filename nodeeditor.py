@@ -1,23 +1,32 @@
 from abc import ABC, abstractmethod
-from typing import Generic, Any
+from collections.abc import Mapping
+from functools import partial
+from time import time
+from typing import Generic, Any, Optional
 
 import kivy
+
+kivy.require("2.0.0")
+# Has to be set before the Window is created, which is deferred until the app runs
+kivy.config.Config.set('input', 'mouse', 'mouse,disable_multitouch')
+
 from kivy.graphics.transformation import Matrix
-from kivy.properties import NumericProperty, ReferenceListProperty, ObjectProperty, ListProperty
-from kivy.core.window import Window
+from kivy.properties import NumericProperty, ReferenceListProperty, ObjectProperty, ListProperty, BooleanProperty
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.layout import Layout
 from kivy.uix.relativelayout import RelativeLayout
 from kivy.uix.scatter import ScatterPlane
-
-kivy.require("2.0.0")
-kivy.config.Config.set('input', 'mouse', 'mouse,disable_multitouch')
-
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.graphics.instructions import Canvas, InstructionGroup
 from kivy.input.providers.mouse import MouseMotionEvent
 from kivy.uix.behaviors import DragBehavior
 from kivy.uix.label import Label
 from kivy.uix.widget import Widget
+from editor_stats import EditorStats
+from layout import layered_layout, relayout, LayerOccupancy
+from node_registry import NodeRegistry
+from pin_index import PinIndex
 from nodes_interface import *
 
 
@@ -45,49 +54,153 @@ class VisualNode(DragBehavior, RelativeLayout):
     node_data: NodeData = ObjectProperty(None)
     node_type: NodeType = ObjectProperty(None)
     pins: list[Connector] = ListProperty()
+    highlighted: bool = BooleanProperty(False)
 
     def render_pins(self):
+        pass
+
+
+class _EntryView(Mapping):
+    """ Read only view of one element of the entries of a registry, so nothing is copied per node """
+
+    def __init__(self, registry: NodeRegistry, get):
+        self.registry = registry
+        self.get_value = get
+
+    def __getitem__(self, node_id: str):
+        return self.get_value(self.registry[node_id])
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self.registry
+
+    def __iter__(self):
+        return iter(self.registry)
+
+    def __len__(self) -> int:
+        return len(self.registry)
 
 
 class NodesContainer(ScatterPlane):
     renderer: NodeRenderer = ObjectProperty(None)
     provider: NodeProvider = ObjectProperty(None)
-    nodes: dict[str, tuple[NodeType, NodeData, VisualNode]] = ObjectProperty(None)
+    nodes: NodeRegistry[tuple[NodeType, NodeData, VisualNode]] = ObjectProperty(None)
     mouse_position: tuple[int, int] = ObjectProperty((0, 0))
+    stats: Optional[EditorStats] = ObjectProperty(None, allownone=True)
+    pin_index: Optional[PinIndex] = ObjectProperty(None, allownone=True)
+    highlighted_pins: list[tuple[str, str]] = ListProperty()
+    relayout_on_connect: bool = BooleanProperty(True)
 
     def __init__(self, **kwargs):
+        from kivy.core.window import Window
+        self.nodes = NodeRegistry()
+        self._occupancy = LayerOccupancy()
+        self._listened_provider = None
+        self._highlighted_nodes: set[str] = set()
+        self.nodes.listeners.append(self._on_nodes)
         super(NodesContainer, self).__init__(**kwargs)
-        self.nodes = {}
         self._keyboard = Window.request_keyboard(
             None, self, 'text')
         Window.bind(mouse_pos=lambda w, p: setattr(self, 'mouse_position', self.to_local(*p)))
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
 
+    def on_provider(self, instance, provider: NodeProvider):
+        if self.pin_index is not None:
+            self.pin_index.detach()
+        self.pin_index = PinIndex(self.nodes, provider) if provider is not None else None
+        if self._listened_provider is not None:
+            self._listened_provider.listeners.remove(self._on_provider_event)
+        self._listened_provider = provider
+        if provider is not None:
+            provider.listeners.append(self._on_provider_event)
+
+    def _on_provider_event(self, event: str, start: Any, end: Any):
+        if event == "connect" and self.relayout_on_connect and end[0].id in self.nodes:
+            # Only the node taking the new input moves, behind its sources
+            self.auto_layout([end[0].id], radius=0)
+
+    def _on_nodes(self, registry: NodeRegistry, added: dict[str, tuple], removed: dict[str, tuple]):
+        for ni in removed:
+            self._occupancy.discard(ni)
+            self._highlighted_nodes.discard(ni)
+
+    def _on_node_moved(self, ni: str, widget: Widget, center: list[float]):
+        if ni in self.nodes:
+            self._occupancy.set(ni, tuple(center))
+
+    def highlight_compatible(self, node_id: str, pin_id: str):
+        self.highlighted_pins = self.pin_index.compatible(node_id, pin_id) if self.pin_index is not None else []
+
+    def highlight_node(self, node_id: str):
+        """ Highlights the pins compatible with any free pin of `node_id` """
+        if self.pin_index is None:
+            self.highlighted_pins = []
+            return
+        pins = {}
+        for pin_id in self.nodes[node_id][1].pins:
+            pins.update(dict.fromkeys(self.pin_index.compatible(node_id, pin_id)))
+        self.highlighted_pins = list(pins)
+
+    def clear_highlight(self):
+        self.highlighted_pins = []
+
+    def on_highlighted_pins(self, instance, pins: list[tuple[str, str]]):
+        # Pins have no widgets of their own yet, so the nodes owning them are tinted
+        node_ids = {ni for ni, pin_id in pins if ni in self.nodes}
+        for ni in self._highlighted_nodes - node_ids:
+            if ni in self.nodes:
+                self.nodes[ni][2].highlighted = False
+        for ni in node_ids - self._highlighted_nodes:
+            self.nodes[ni][2].highlighted = True
+        self._highlighted_nodes = node_ids
+
     def render_node(self, node_type: NodeType, node_data: NodeData):
-        inner = self.renderer.render_node(node_type, node_data)
+        if self.stats is not None:
+            with self.stats.measure_render():
+                inner = self.renderer.render_node(node_type, node_data)
+        else:
+            inner = self.renderer.render_node(node_type, node_data)
         vis = VisualNode()
+        vis.node_type = node_type
+        vis.node_data = node_data
         vis.inner = inner
         vis.add_widget(inner)
         inner.pos = 10, 10
         return vis
 
+    def auto_layout(self, changed: Optional[list[str]] = None, radius: int = 1):
+        """ Arranges all nodes in layers, or only the region around the `changed` node ids """
+        nodes = _EntryView(self.nodes, lambda entry: entry[1])
+        if changed is None:
+            positions = layered_layout(nodes)
+        else:
+            positions = relayout(nodes, _EntryView(self.nodes, lambda entry: tuple(entry[2].center)),
+                                 changed, radius, occupancy=self._occupancy)
+        for ni, pos in positions.items():
+            self.nodes[ni][2].center = pos
+
     def _on_keyboard_down(self, keyboard, keycode, text, modifiers):
-        if text in "0123456789":
+        if text == "l":
+            self.auto_layout()
+        elif text and text in "0123456789":
             nt = self.provider.node_types()[(int(text) - 1) % len(self.provider.node_types())]
             self._create_node(nt, {}, self.mouse_position)
 
     def _create_node(self, nt: NodeType, arguments: dict[str, Any], pos: tuple[int, int]):
-        if self.nodes:
-            ni = str(max(map(int, self.nodes)) + 1)
-        else:
-            ni = 1
-        nd = nt.create(ni, {})
+        ni = self.nodes.new_id()
+        nd = nt.create(ni, dict(arguments))
         v = self.render_node(nt, nd)
-        self.nodes[ni] = nt, nd, v
+        self.nodes.add(nt, nd, v)
         self.add_widget(v)
+        v.bind(center=partial(self._on_node_moved, ni))
         v.center = self.to_local(*pos)
 
     def on_touch_down(self, touch: MouseMotionEvent):
+        handled = self._handle_touch_down(touch)
+        if self.stats is not None:
+            self.stats.record_touch(time() - touch.time_start)
+        return handled
+
+    def _handle_touch_down(self, touch: MouseMotionEvent):
         if touch.button == "mouse5":
             if self.provider is None:
                 print("Still None")
@@ -95,6 +208,15 @@ class NodesContainer(ScatterPlane):
                 nt = self.provider.node_types()[0]
                 self._create_node(nt, {}, touch.pos)
             return True
+        elif touch.button == "right":
+            # Right click on a node shows where its pins can connect, on the background it clears that
+            x, y = self.to_local(*touch.pos)
+            hit = next((c for c in self.children if isinstance(c, VisualNode) and c.collide_point(x, y)), None)
+            if hit is None:
+                self.clear_highlight()
+            else:
+                self.highlight_node(hit.node_data.id)
+            return True
         elif touch.is_mouse_scrolling:
             factor = None
             if touch.button == 'scrolldown':
@@ -114,21 +236,76 @@ class NodeEditor(Widget):
     nodes_container: NodesContainer = ObjectProperty(None)
     renderer: NodeRenderer = ObjectProperty(None)
     provider: NodeProvider = ObjectProperty(None)
+    stats: Optional[EditorStats] = ObjectProperty(None, allownone=True)
 
 
 class FullNodeEditor(Widget):
     renderer: NodeRenderer = ObjectProperty(None)
     provider: NodeProvider = ObjectProperty(None)
+    stats: Optional[EditorStats] = ObjectProperty(None, allownone=True)
+
+
+class StatsOverlay(Label):
+    pass
+
+
+def count_tree(widget: Widget) -> tuple[int, int]:
+    """ Returns the number of widgets and canvas instructions in the tree below `widget` """
+    widgets = instructions = 0
+    stack = [widget]
+    while stack:
+        w = stack.pop()
+        widgets += 1
+        stack.extend(w.children)
+        canvas = w.canvas
+        groups = [canvas]
+        if canvas.has_before:
+            groups.append(canvas.before)
+        if canvas.has_after:
+            groups.append(canvas.after)
+        while groups:
+            g = groups.pop()
+            for i in g.children:
+                if isinstance(i, Canvas):
+                    # The canvas of a child widget, counted when the walk reaches that widget
+                    continue
+                instructions += 1
+                if isinstance(i, InstructionGroup):
+                    groups.append(i)
+    return widgets, instructions
 
 
 class NodeEditorApp(App):
-    def __init__(self, provider: NodeProvider, renderer: NodeRenderer):
+    stats_interval: float = 1.0
+
+    def __init__(self, provider: NodeProvider, renderer: NodeRenderer, stats: Optional[EditorStats] = None):
         super(NodeEditorApp, self).__init__()
         self.provider = provider
         self.renderer = renderer
+        self.stats = stats
+        self.overlay = None
 
     def build(self):
         editor = FullNodeEditor()
         editor.provider = self.provider
         editor.renderer = self.renderer
+        if self.stats is not None:
+            editor.stats = self.stats
+            self.overlay = StatsOverlay()
+            editor.add_widget(self.overlay)
+            Clock.schedule_interval(lambda dt: self.stats.record_frame(dt), 0)
+            Clock.schedule_interval(self._update_stats, self.stats_interval)
+            from kivy.core.window import Window
+            Window.bind(on_key_down=self._on_key_down)
         return editor
+
+    def _update_stats(self, dt):
+        self.stats.record_counts(*count_tree(self.root))
+        self.stats.log()
+        if self.overlay.opacity:
+            self.overlay.text = self.stats.format_summary()
+
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        if key == 293:  # F12
+            self.overlay.opacity = 0 if self.overlay.opacity else 1
+            return True
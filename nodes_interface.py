@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
+from collections.abc import Mapping
 from typing import Generic, TypeVar, Union, Literal, TYPE_CHECKING, Any, Optional, Callable
 
 if TYPE_CHECKING:
@@ -11,7 +12,7 @@ JSONData: TypeAlias = Union[dict[str, 'JSONData'], list['JSONData'], str, float,
 
 __all__ = [
     'JSONData', 'NodePin', 'NodeData', 'NodeParameter', 'NodeType', 'NodeProvider', 'ND', 'T',
-    'ChoiceParameter', 'FloatParameter', 'generic_load_json'
+    'ChoiceParameter', 'FloatParameter', 'generic_load_json', 'ProviderListener', 'store_graph', 'load_graph'
 ]
 
 
@@ -69,7 +70,7 @@ class FloatParameter(NodeParameter[float]):
     max: Optional[float]
 
     def check(self, value: float) -> bool:
-        return (self.min is None or value < self.min) and (self.max is None or value < self.max)
+        return (self.min is None or self.min <= value) and (self.max is None or value <= self.max)
 
 
 ND = TypeVar('ND', bound=NodeData)
@@ -93,18 +94,33 @@ class NodeType(ABC, Generic[ND]):
             else:
                 kwargs[n] = p.default
         assert not arguments, arguments
-        print(kwargs)
         return callback(node_id, **kwargs)
 
     def load_json(self, data: JSONData) -> ND:
         raise NotImplementedError
 
 
+ProviderListener = Callable[..., None]
+
+
 class NodeProvider(ABC, Generic[ND]):
     @abstractmethod
     def node_types(self) -> list[NodeType[ND]]:
         raise NotImplementedError
 
+    @property
+    def listeners(self) -> list[ProviderListener]:
+        """ Callbacks called with `("connect" | "disconnect", start, end)` or `("set", (node, name), value)` """
+        try:
+            return self._listeners
+        except AttributeError:
+            self._listeners = []
+            return self._listeners
+
+    def _notify(self, event: str, *args):
+        for listener in list(self.listeners):
+            listener(event, *args)
+
     def is_compatible(self, start: tuple[ND, str], end: tuple[ND, str]) -> bool:
         sp = start[0].pins[start[1]]
         ep = end[0].pins[end[1]]
@@ -119,12 +135,21 @@ class NodeProvider(ABC, Generic[ND]):
             raise ValueError(f"Can't connect another pin to end {end}")
         sp.target_ids.append((end[0].id, ep.pin_id))
         ep.target_ids.append((start[0].id, sp.pin_id))
+        self._notify("connect", start, end)
 
     def disconnect(self, start: tuple[ND, str], end: tuple[ND, str]):
         sp = start[0].pins[start[1]]
         ep = end[0].pins[end[1]]
         sp.target_ids.remove((end[0].id, ep.pin_id))
         ep.target_ids.remove((start[0].id, sp.pin_id))
+        self._notify("disconnect", start, end)
+
+    def set_parameter(self, node_type: NodeType[ND], node: ND, name: str, value: Any):
+        param = node_type.parameters[name]
+        if not param.check(value):
+            raise ValueError(f"Invalid value for Parameter {name}: {value!r}")
+        setattr(node, name, value)
+        self._notify("set", (node, name), value)
 
 
 def generic_store_json(node_data: ND, **extra: Any) -> JSONData:
@@ -152,6 +177,19 @@ def generic_load_json(json: JSONData, template: NodeData):
     for tpin_id, tpin in template.pins.items():
         targets = pins.pop(tpin_id, None)
         assert targets is not None, f"Missing data in json for pin {tpin_id} of {template.id}"
-        tpin.target_ids = [t.split('|') for t in targets]
+        tpin.target_ids = [tuple(t.split('|')) for t in targets]
     assert not pins, f"Extra pin information in json (remaining {pins})"
     assert not json, f"Extra data in json has to be used before `generic_load_json` is called (remaining {json})"
+
+
+def store_graph(nodes: Mapping[str, tuple[NodeType, NodeData, ...]]) -> JSONData:
+    """ Stores a whole graph as `{node_id: {"type": type_id, "data": node_json}}` """
+    return {node_id: {"type": entry[0].id, "data": entry[1].to_json()} for node_id, entry in nodes.items()}
+
+
+def load_graph(json: JSONData, node_types: Callable[[str], NodeType]) -> dict[str, tuple[NodeType, NodeData]]:
+    result = {}
+    for node_id, data in json.items():
+        nt = node_types(data["type"])
+        result[node_id] = nt, nt.load_json(dict(data["data"]))
+    return result
@@ -0,0 +1,416 @@
+from __future__ import annotations
+
+import copy
+import dataclasses
+from collections.abc import Mapping, Iterator, Hashable
+from typing import Any, Optional, TypeVar, Generic
+
+from node_registry import NodeRegistry
+from nodes_interface import *
+
+__all__ = ['HAMT', 'GraphVersion', 'GraphHistory', 'VersionTracker']
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+
+class _Sub:
+    """ Marks a slot of a `_Bitmap` that holds a sub node instead of a key """
+
+    def __repr__(self):
+        return "<sub>"
+
+
+_SUB = _Sub()
+_MISSING = object()
+
+
+def _hash(key) -> int:
+    return hash(key) & _HASH_MASK
+
+
+class _Bitmap:
+    """ Trie node, `array` holds `key, value` pairs or `_SUB, node` for each set bit of `bitmap` """
+    __slots__ = ('bitmap', 'array')
+
+    def __init__(self, bitmap: int, array: tuple):
+        self.bitmap = bitmap
+        self.array = array
+
+    def _index(self, bit: int) -> int:
+        return 2 * bin(self.bitmap & (bit - 1)).count("1")
+
+    def get(self, shift: int, h: int, key, default):
+        bit = 1 << ((h >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return default
+        i = self._index(bit)
+        k, v = self.array[i], self.array[i + 1]
+        if k is _SUB:
+            return v.get(shift + _BITS, h, key, default)
+        if k is key or k == key:
+            return v
+        return default
+
+    def assoc(self, shift: int, h: int, key, value) -> tuple[_Bitmap, bool]:
+        bit = 1 << ((h >> shift) & _MASK)
+        i = self._index(bit)
+        a = self.array
+        if not self.bitmap & bit:
+            return _Bitmap(self.bitmap | bit, a[:i] + (key, value) + a[i:]), True
+        k, v = a[i], a[i + 1]
+        if k is _SUB:
+            sub, added = v.assoc(shift + _BITS, h, key, value)
+            if sub is v:
+                return self, False
+            return _Bitmap(self.bitmap, a[:i + 1] + (sub,) + a[i + 2:]), added
+        if k is key or k == key:
+            if v is value:
+                return self, False
+            return _Bitmap(self.bitmap, a[:i + 1] + (value,) + a[i + 2:]), False
+        sub = _pair(shift + _BITS, _hash(k), k, v, h, key, value)
+        return _Bitmap(self.bitmap, a[:i] + (_SUB, sub) + a[i + 2:]), True
+
+    def without(self, shift: int, h: int, key):
+        bit = 1 << ((h >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return self
+        i = self._index(bit)
+        a = self.array
+        k, v = a[i], a[i + 1]
+        if k is _SUB:
+            sub = v.without(shift + _BITS, h, key)
+            if sub is v:
+                return self
+            if sub is not None:
+                single = sub.single()
+                replacement = single if single is not None else (_SUB, sub)
+                return _Bitmap(self.bitmap, a[:i] + replacement + a[i + 2:])
+        elif not (k is key or k == key):
+            return self
+        if self.bitmap == bit:
+            return None
+        return _Bitmap(self.bitmap & ~bit, a[:i] + a[i + 2:])
+
+    def single(self) -> Optional[tuple]:
+        if len(self.array) == 2 and self.array[0] is not _SUB:
+            return self.array
+        return None
+
+    def items(self) -> Iterator[tuple]:
+        a = self.array
+        for i in range(0, len(a), 2):
+            if a[i] is _SUB:
+                yield from a[i + 1].items()
+            else:
+                yield a[i], a[i + 1]
+
+
+class _Collision:
+    """ Keys whose full hashes are equal, searched linearly """
+    __slots__ = ('array',)
+
+    def __init__(self, array: tuple):
+        self.array = array
+
+    def _find(self, key) -> int:
+        a = self.array
+        for i in range(0, len(a), 2):
+            if a[i] is key or a[i] == key:
+                return i
+        return -1
+
+    def get(self, shift: int, h: int, key, default):
+        i = self._find(key)
+        return default if i < 0 else self.array[i + 1]
+
+    def assoc(self, shift: int, h: int, key, value) -> tuple[_Collision, bool]:
+        i = self._find(key)
+        if i < 0:
+            return _Collision(self.array + (key, value)), True
+        if self.array[i + 1] is value:
+            return self, False
+        return _Collision(self.array[:i + 1] + (value,) + self.array[i + 2:]), False
+
+    def without(self, shift: int, h: int, key):
+        i = self._find(key)
+        if i < 0:
+            return self
+        if len(self.array) == 2:
+            return None
+        return _Collision(self.array[:i] + self.array[i + 2:])
+
+    def single(self) -> Optional[tuple]:
+        return self.array if len(self.array) == 2 else None
+
+    def items(self) -> Iterator[tuple]:
+        a = self.array
+        for i in range(0, len(a), 2):
+            yield a[i], a[i + 1]
+
+
+def _pair(shift: int, h1: int, k1, v1, h2: int, k2, v2):
+    if shift >= _HASH_BITS:
+        return _Collision((k1, v1, k2, v2))
+    i1 = (h1 >> shift) & _MASK
+    i2 = (h2 >> shift) & _MASK
+    if i1 == i2:
+        return _Bitmap(1 << i1, (_SUB, _pair(shift + _BITS, h1, k1, v1, h2, k2, v2)))
+    if i1 < i2:
+        return _Bitmap((1 << i1) | (1 << i2), (k1, v1, k2, v2))
+    return _Bitmap((1 << i1) | (1 << i2), (k2, v2, k1, v1))
+
+
+class HAMT(Mapping[K, V], Generic[K, V]):
+    """ Immutable hash array mapped trie, `set` and `delete` return a new map sharing all untouched nodes """
+    __slots__ = ('_root', '_len')
+
+    def __init__(self, items: Mapping[K, V] = None):
+        self._root = _Bitmap(0, ())
+        self._len = 0
+        if items:
+            for k, v in items.items():
+                self._root, added = self._root.assoc(0, _hash(k), k, v)
+                self._len += added
+
+    @classmethod
+    def _make(cls, root: _Bitmap, length: int) -> HAMT[K, V]:
+        new = cls.__new__(cls)
+        new._root = root
+        new._len = length
+        return new
+
+    def set(self, key: K, value: V) -> HAMT[K, V]:
+        root, added = self._root.assoc(0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return self._make(root, self._len + added)
+
+    def delete(self, key: K) -> HAMT[K, V]:
+        root = self._root.without(0, _hash(key), key)
+        if root is self._root:
+            raise KeyError(key)
+        return self._make(root if root is not None else _Bitmap(0, ()), self._len - 1)
+
+    def get(self, key: K, default: Any = None):
+        return self._root.get(0, _hash(key), key, default)
+
+    def __getitem__(self, key: K) -> V:
+        value = self._root.get(0, _hash(key), key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return self._root.get(0, _hash(key), key, _MISSING) is not _MISSING
+
+    def items(self) -> Iterator[tuple[K, V]]:
+        return self._root.items()
+
+    def __iter__(self) -> Iterator[K]:
+        return (k for k, v in self._root.items())
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self):
+        return f"HAMT({dict(self.items())!r})"
+
+
+Edge = tuple[str, str, str, str]
+
+
+def _copy_node(node: NodeData) -> NodeData:
+    """ Copies a node together with its pins, the only part of it edits mutate """
+    new = copy.copy(node)
+    new.pins = {pin_id: dataclasses.replace(pin, target_ids=list(pin.target_ids)) for pin_id, pin in node.pins.items()}
+    return new
+
+
+class GraphVersion:
+    """ One immutable version of a graph.
+
+    `nodes` maps node ids to `(NodeType, NodeData)` and `edges` holds every connection as
+    `(start_id, start_pin, end_id, end_pin)`. The `NodeData` objects are shared between versions and must
+    not be mutated, every edit copies the nodes it touches. Edits are O(log n + pins of the touched nodes).
+    """
+    __slots__ = ('nodes', 'edges')
+
+    def __init__(self, nodes: HAMT[str, tuple[NodeType, NodeData]] = None, edges: HAMT[Edge, None] = None):
+        self.nodes = nodes if nodes is not None else HAMT()
+        self.edges = edges if edges is not None else HAMT()
+
+    @classmethod
+    def from_nodes(cls, nodes: Mapping[str, tuple[NodeType, NodeData, ...]]) -> GraphVersion:
+        version = cls()
+        for entry in nodes.values():
+            version = version.add_node(entry[0], entry[1])
+        return version
+
+    def to_nodes(self) -> dict[str, tuple[NodeType, NodeData]]:
+        """ Mutable copies of all nodes, e.g. to load this version back into a `NodeRegistry` """
+        return {node_id: (nt, _copy_node(nd)) for node_id, (nt, nd) in self.nodes.items()}
+
+    def node_data(self) -> dict[str, NodeData]:
+        """ The shared nodes in the form `Calculator.evaluate` takes, which only reads them """
+        return {node_id: nd for node_id, (nt, nd) in self.nodes.items()}
+
+    def add_node(self, node_type: NodeType, node: NodeData) -> GraphVersion:
+        if node.id in self.nodes:
+            raise ValueError(f"{node.id} already defined")
+        node = _copy_node(node)
+        edges = self.edges
+        for pin_id, pin in node.pins.items():
+            for other_id, other_pin in pin.target_ids:
+                if other_id in self.nodes:
+                    edges = edges.set(self._edge(node, pin_id, other_id, other_pin), None)
+        return GraphVersion(self.nodes.set(node.id, (node_type, node)), edges)
+
+    def _edge(self, node: NodeData, pin_id: str, other_id: str, other_pin: str) -> Edge:
+        if "out" in node.pins[pin_id].io:
+            return node.id, pin_id, other_id, other_pin
+        return other_id, other_pin, node.id, pin_id
+
+    def remove_node(self, node_id: str) -> GraphVersion:
+        nt, node = self.nodes[node_id]
+        nodes = self.nodes
+        edges = self.edges
+        for pin_id, pin in node.pins.items():
+            for other_id, other_pin in pin.target_ids:
+                edge = self._edge(node, pin_id, other_id, other_pin)
+                if edge in edges:
+                    edges = edges.delete(edge)
+                if other_id != node_id and other_id in nodes:
+                    ot, other = nodes[other_id]
+                    other = _copy_node(other)
+                    other.pins[other_pin].target_ids.remove((node_id, pin_id))
+                    nodes = nodes.set(other_id, (ot, other))
+        return GraphVersion(nodes.delete(node_id), edges)
+
+    def connect(self, start: tuple[str, str], end: tuple[str, str]) -> GraphVersion:
+        st, sn = self.nodes[start[0]]
+        et, en = self.nodes[end[0]]
+        if not sn.pins[start[1]].multi_connect and sn.pins[start[1]].target_ids:
+            raise ValueError(f"Can't connect another pin from start {start}")
+        if not en.pins[end[1]].multi_connect and en.pins[end[1]].target_ids:
+            raise ValueError(f"Can't connect another pin to end {end}")
+        sn = _copy_node(sn)
+        sn.pins[start[1]].target_ids.append(end)
+        nodes = self.nodes.set(start[0], (st, sn))
+        if end[0] == start[0]:
+            en = sn
+        else:
+            en = _copy_node(en)
+            nodes = nodes.set(end[0], (et, en))
+        en.pins[end[1]].target_ids.append(start)
+        return GraphVersion(nodes, self.edges.set((*start, *end), None))
+
+    def disconnect(self, start: tuple[str, str], end: tuple[str, str]) -> GraphVersion:
+        edges = self.edges.delete((*start, *end))
+        st, sn = self.nodes[start[0]]
+        sn = _copy_node(sn)
+        sn.pins[start[1]].target_ids.remove(end)
+        nodes = self.nodes.set(start[0], (st, sn))
+        et, en = nodes[end[0]]
+        if en is not sn:
+            en = _copy_node(en)
+        en.pins[end[1]].target_ids.remove(start)
+        return GraphVersion(nodes.set(end[0], (et, en)), edges)
+
+    def set_parameter(self, node_id: str, name: str, value: Any) -> GraphVersion:
+        nt, node = self.nodes[node_id]
+        if not nt.parameters[name].check(value):
+            raise ValueError(f"Invalid value for Parameter {name}: {value!r}")
+        node = _copy_node(node)
+        setattr(node, name, value)
+        return GraphVersion(self.nodes.set(node_id, (nt, node)), self.edges)
+
+    def replace_node(self, node_type: NodeType, node: NodeData) -> GraphVersion:
+        """ Replaces a node by a copy of `node`, the connections stay untouched """
+        return GraphVersion(self.nodes.set(node.id, (node_type, _copy_node(node))), self.edges)
+
+
+class GraphHistory:
+    """ Undo/redo over graph versions, every step only keeps a reference to an O(1) snapshot """
+
+    def __init__(self, version: GraphVersion = None, limit: Optional[int] = None):
+        self.current = version if version is not None else GraphVersion()
+        self.limit = limit
+        self._undo: list[GraphVersion] = []
+        self._redo: list[GraphVersion] = []
+
+    def commit(self, version: GraphVersion):
+        if version is self.current:
+            return
+        self._undo.append(self.current)
+        if self.limit is not None and len(self._undo) > self.limit:
+            del self._undo[0]
+        self._redo.clear()
+        self.current = version
+
+    def undo(self) -> GraphVersion:
+        self._redo.append(self.current)
+        self.current = self._undo.pop()
+        return self.current
+
+    def redo(self) -> GraphVersion:
+        self._undo.append(self.current)
+        self.current = self._redo.pop()
+        return self.current
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+
+class VersionTracker:
+    """ Mirrors the edits on a `NodeRegistry` and `NodeProvider` into a `GraphHistory`.
+
+    `snapshot()` is O(1), so the current graph can be evaluated while the user keeps editing.
+    """
+
+    def __init__(self, registry: NodeRegistry, provider: NodeProvider, limit: Optional[int] = None):
+        self.registry = registry
+        self.provider = provider
+        self.history = GraphHistory(GraphVersion.from_nodes(registry), limit)
+        registry.listeners.append(self._on_registry)
+        provider.listeners.append(self._on_provider)
+
+    def detach(self):
+        self.registry.listeners.remove(self._on_registry)
+        self.provider.listeners.remove(self._on_provider)
+
+    def snapshot(self) -> GraphVersion:
+        return self.history.current
+
+    def _on_registry(self, registry: NodeRegistry, added: dict[str, tuple], removed: dict[str, tuple]):
+        version = self.history.current
+        for node_id in removed:
+            version = version.remove_node(node_id)
+        for entry in added.values():
+            version = version.add_node(entry[0], entry[1])
+        self.history.commit(version)
+
+    def _on_provider(self, event: str, *args):
+        version = self.history.current
+        if event == "set":
+            (node, name), value = args
+            if node.id in version.nodes:
+                self.history.commit(version.replace_node(version.nodes[node.id][0], node))
+            return
+        (start, start_pin), (end, end_pin) = args
+        if start.id not in version.nodes or end.id not in version.nodes:
+            return
+        if event == "connect":
+            self.history.commit(version.connect((start.id, start_pin), (end.id, end_pin)))
+        else:
+            self.history.commit(version.disconnect((start.id, start_pin), (end.id, end_pin)))
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from typing import Any
+
+from node_registry import NodeRegistry
+from nodes_interface import *
+from prefix_index import PrefixIndex
+
+__all__ = ['PinIndex']
+
+
+def _directions(pin: NodePin) -> tuple[str, ...]:
+    return tuple(d for d in ("in", "out") if d in pin.io)
+
+
+def _is_free(pin: NodePin) -> bool:
+    return pin.multi_connect or not pin.target_ids
+
+
+class PinIndex:
+    """ Index of the pins that can take another connection, keyed by pin type and direction.
+
+    Kept up to date through the listeners of the registry and the provider, so looking up the legal targets
+    of a pin costs O(result) instead of a scan over all pins. Each bucket also keeps a `PrefixIndex` of the ids of
+    the nodes with a free pin in it, for completion.
+    """
+
+    def __init__(self, registry: NodeRegistry, provider: NodeProvider):
+        self.registry = registry
+        self.provider = provider
+        self._free: dict[tuple[Any, str], dict[tuple[str, str], None]] = {}
+        self._node_counts: dict[tuple[Any, str], dict[str, int]] = {}
+        self._node_ids: dict[tuple[Any, str], PrefixIndex] = {}
+        registry.listeners.append(self._on_registry)
+        provider.listeners.append(self._on_provider)
+        self._on_registry(registry, dict(registry), {})
+
+    def detach(self):
+        self.registry.listeners.remove(self._on_registry)
+        self.provider.listeners.remove(self._on_provider)
+
+    def _update(self, node_id: str, pin: NodePin, present: bool, changes: dict[tuple[Any, str], tuple[list, list]]):
+        key = (node_id, pin.pin_id)
+        free = present and _is_free(pin)
+        for d in _directions(pin):
+            bucket_key = (pin.type, d)
+            bucket = self._free.setdefault(bucket_key, {})
+            counts = self._node_counts.setdefault(bucket_key, {})
+            if free and key not in bucket:
+                bucket[key] = None
+                counts[node_id] = counts.get(node_id, 0) + 1
+                if counts[node_id] == 1:
+                    changes.setdefault(bucket_key, ([], []))[0].append(node_id)
+            elif not free and key in bucket:
+                del bucket[key]
+                counts[node_id] -= 1
+                if not counts[node_id]:
+                    del counts[node_id]
+                    changes.setdefault(bucket_key, ([], []))[1].append(node_id)
+
+    def _apply(self, changes: dict[tuple[Any, str], tuple[list, list]]):
+        for bucket_key, (added, removed) in changes.items():
+            self._node_ids.setdefault(bucket_key, PrefixIndex()).bulk(added, removed)
+
+    def _on_registry(self, registry: NodeRegistry, added: dict[str, tuple], removed: dict[str, tuple]):
+        changes = {}
+        for node_id, entry in removed.items():
+            for pin in entry[1].pins.values():
+                self._update(node_id, pin, False, changes)
+        for node_id, entry in added.items():
+            for pin in entry[1].pins.values():
+                self._update(node_id, pin, True, changes)
+        self._apply(changes)
+
+    def _on_provider(self, event: str, start: tuple[NodeData, str], end: Any):
+        if event not in ("connect", "disconnect"):
+            return
+        changes = {}
+        for node, pin_id in (start, end):
+            if node.id in self.registry:
+                self._update(node.id, node.pins[pin_id], True, changes)
+        self._apply(changes)
+
+    def is_free(self, node_id: str, pin_id: str, io: str) -> bool:
+        pin = self.registry[node_id][1].pins[pin_id]
+        return (node_id, pin_id) in self._free.get((pin.type, io), ())
+
+    def free_pins(self, pin_type: Any, io: str) -> list[tuple[str, str]]:
+        return list(self._free.get((pin_type, io), ()))
+
+    def compatible(self, node_id: str, pin_id: str) -> list[tuple[str, str]]:
+        """ All free pins a connection from or to `node_id.pin_id` could be made with """
+        pin = self.registry[node_id][1].pins[pin_id]
+        if not _is_free(pin):
+            return []
+        result = {}
+        for d in _directions(pin):
+            result.update(self._free.get((pin.type, "in" if d == "out" else "out"), {}))
+        result.pop((node_id, pin_id), None)
+        return list(result)
+
+    def compatible_nodes(self, node_id: str, pin_id: str, prefix: str = "") -> list[str]:
+        """ Sorted ids starting with `prefix` of the nodes with a free pin compatible with `node_id.pin_id` """
+        pin = self.registry[node_id][1].pins[pin_id]
+        if not _is_free(pin):
+            return []
+        result = []
+        for d in _directions(pin):
+            bucket_key = (pin.type, "in" if d == "out" else "out")
+            if bucket_key in self._node_ids:
+                ids = self._node_ids[bucket_key].complete(prefix)
+                if node_id in ids and self._node_counts[bucket_key][node_id] == 1 \
+                        and (node_id, pin_id) in self._free[bucket_key]:
+                    # The only free pin of the node in this bucket is the pin itself
+                    ids.remove(node_id)
+                result.append(ids)
+        if len(result) == 1:
+            return result[0]
+        return sorted(set().union(*result))
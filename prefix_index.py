@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections.abc import Iterable
+
+from node_registry import NodeRegistry
+
+__all__ = ['PrefixIndex']
+
+
+class PrefixIndex:
+    """ Sorted array of names that answers prefix queries with two bisections.
+
+    Use `follow` to keep it in sync with the node ids of a `NodeRegistry`.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._names = sorted(set(names))
+
+    def follow(self, registry: NodeRegistry):
+        self.update(registry, dict(registry), {})
+        registry.listeners.append(self.update)
+
+    def update(self, registry: NodeRegistry, added: dict[str, tuple], removed: dict[str, tuple]):
+        self.bulk(added, removed)
+
+    def bulk(self, added: Iterable[str], removed: Iterable[str]):
+        """ Adds and removes many names, large changes rebuild the array instead of inserting one by one """
+        added = list(added)
+        removed = list(removed)
+        if len(added) + len(removed) > len(self._names) // 8 + 1:
+            names = set(self._names)
+            names.difference_update(removed)
+            names.update(added)
+            self._names = sorted(names)
+        else:
+            for name in removed:
+                self.discard(name)
+            for name in added:
+                self.add(name)
+
+    def add(self, name: str):
+        i = bisect_left(self._names, name)
+        if i == len(self._names) or self._names[i] != name:
+            self._names.insert(i, name)
+
+    def discard(self, name: str):
+        i = bisect_left(self._names, name)
+        if i < len(self._names) and self._names[i] == name:
+            del self._names[i]
+
+    def range(self, prefix: str) -> tuple[int, int]:
+        start = bisect_left(self._names, prefix)
+        if not prefix or prefix[-1] == chr(0x10FFFF):
+            return start, len(self._names)
+        # Every string starting with `prefix` sorts before the prefix with its last character incremented
+        end = bisect_left(self._names, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        return start, end
+
+    def complete(self, prefix: str, limit: int = None) -> list[str]:
+        start, end = self.range(prefix)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self._names[start:end]
+
+    def __contains__(self, name: object) -> bool:
+        i = bisect_left(self._names, name)
+        return i < len(self._names) and self._names[i] == name
+
+    def __len__(self) -> int:
+        return len(self._names)